@@ -0,0 +1,88 @@
+"""Adaptive output-token budgets and truncation detection for LM calls."""
+import math
+import threading
+from collections import deque
+
+from .repair import TAG_RE
+
+CONTINUE_PROMPT = (
+    "Your previous answer was cut off. Continue exactly where it stopped, "
+    "without repeating anything."
+)
+
+
+class TokenBudget:
+    """Learns a route's output-size distribution and suggests ``max_tokens``.
+
+    Until ``min_samples`` calls have been seen the ceiling is used. After
+    that the suggestion is the 95th percentile of recent completions plus
+    ``headroom``, rounded up to a multiple of 64 and kept within
+    ``[floor, ceiling]``. Outputs that still get cut off are continued
+    rather than regenerated, so a tight budget costs a round trip, not
+    the whole output.
+    """
+
+    def __init__(
+        self,
+        ceiling: int = 1000,
+        floor: int = 256,
+        window: int = 50,
+        min_samples: int = 5,
+        headroom: float = 1.25,
+    ):
+        self.ceiling = ceiling
+        self.floor = min(floor, ceiling)
+        self.min_samples = min_samples
+        self.headroom = headroom
+        self.samples = deque(maxlen=window)
+        self.calls = 0
+        self.truncations = 0
+        self.continuations = 0
+        self._lock = threading.Lock()
+
+    def suggest(self) -> int:
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return self.ceiling
+            ordered = sorted(self.samples)
+            p95 = ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+        budget = math.ceil(p95 * self.headroom / 64) * 64
+        return max(self.floor, min(self.ceiling, budget))
+
+    def record(self, completion_tokens: int, truncated: bool, continuations: int):
+        with self._lock:
+            self.samples.append(completion_tokens)
+            self.calls += 1
+            self.truncations += int(truncated)
+            self.continuations += continuations
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count when the provider reports no usage."""
+    return max(1, len(text) // 4)
+
+
+def has_unclosed_element(text: str) -> bool:
+    """True if some XML element in ``text`` is opened but never closed."""
+    stack = []
+    for match in TAG_RE.finditer(text):
+        is_close, name, _, self_closing = match.groups()
+        if self_closing:
+            continue
+        if not is_close:
+            stack.append(name)
+        elif name in stack:
+            while stack.pop() != name:
+                pass
+    return bool(stack)
+
+
+def is_truncated(text: str, finish_reason: str = None, expect_xml: bool = True) -> bool:
+    """Detect a cut-off completion.
+
+    A reported finish_reason is trusted. Without one, an unclosed XML element
+    means the output was most likely cut off, but only if XML is expected.
+    """
+    if finish_reason:
+        return finish_reason == "length"
+    return expect_xml and has_unclosed_element(text)
@@ -1,11 +1,12 @@
 import typer
 import json
 import os
-import subprocess
 from rich.console import Console
 import xml.etree.ElementTree as ET
 import dspy
 from .unified import UnifiedModule
+from .shell import ShellSession
+from .files import apply_file_operations
 from .schema import INPUT_XML_SCHEMA, OUTPUT_XML_SCHEMA
 
 app = typer.Typer()
@@ -65,22 +66,104 @@ def optimize(
     optimizer: str = typer.Option(
         "bootstrap", 
         help="Optimizer to use: bootstrap, random_search, mipro"
-    )
+    ),
+    config: str = typer.Option(None, help="JSON routing config with per-module model settings (agent, rater, proposer)"),
+    rater_model: str = typer.Option(None, help="Model for the rater (default: same as --model)"),
+    proposer_model: str = typer.Option(None, help="Model for optimizer instruction proposals"),
+    workers: int = typer.Option(0, help="Local worker processes for metric evaluation (random_search/mipro only)"),
+    queue_dir: str = typer.Option(None, help="Shared job queue directory; also used by `dspy-agent worker` on other hosts"),
+    num_threads: int = typer.Option(None, help="Parallel evaluations submitted by the optimizer"),
+    job_timeout: float = typer.Option(600, help="Seconds to wait for a worker to finish a metric job"),
 ):
     """Optimize the DSPy module using training data."""
     from .optimization import Optimizer
     
     try:
-        optimizer = Optimizer(model_name=model, optimizer_type=optimizer)
+        optimizer = Optimizer(
+            model_name=model,
+            optimizer_type=optimizer,
+            config_path=config,
+            rater_model=rater_model,
+            proposer_model=proposer_model,
+            workers=workers,
+            queue_dir=queue_dir,
+            num_threads=num_threads,
+            job_timeout=job_timeout,
+        )
         optimizer.optimize(training_data)
     except Exception as e:
         console.print(f"Optimization failed: {str(e)}", style="red")
         raise typer.Exit(code=1)
 
+@app.command()
+def worker(
+    queue_dir: str = typer.Argument(..., help="Job queue directory shared with the optimizer"),
+    poll_interval: float = typer.Option(0.2, help="Seconds between checks for new jobs"),
+):
+    """Process optimization jobs from a shared queue directory."""
+    from .workers import run_worker
+
+    console.print(f"Worker polling {queue_dir}", style="bold")
+    run_worker(queue_dir, poll_interval=poll_interval)
+
+@app.command()
+def evaluate(
+    program: str = typer.Argument(..., help="Path to a saved program (e.g. optimized_model.json)"),
+    dataset: str = typer.Argument(..., help="Path to a JSONL dataset"),
+    model: str = typer.Option("deepseek/deepseek-chat", help="The model to use"),
+    config: str = typer.Option(None, help="JSON routing config with per-module model settings (agent, rater, proposer)"),
+    rater_model: str = typer.Option(None, help="Model for the rater (default: same as --model)"),
+    num_threads: int = typer.Option(8, help="Examples evaluated in parallel"),
+    store: str = typer.Option("evaluation_results.db", help="SQLite file with per-example results"),
+    max_retries: int = typer.Option(2, help="Model retries when output XML fails validation"),
+):
+    """Score a saved program on a dataset, re-evaluating only changed examples."""
+    from .evaluation import Evaluator
+
+    try:
+        evaluator = Evaluator(
+            model_name=model,
+            config_path=config,
+            rater_model=rater_model,
+            store_path=store,
+            num_threads=num_threads,
+            max_retries=max_retries,
+        )
+        summary = evaluator.evaluate(program, dataset)
+    except Exception as e:
+        console.print(f"Evaluation failed: {str(e)}", style="red")
+        raise typer.Exit(code=1)
+
+    console.print(f"Program version: {summary['program_hash'][:12]}", style="bold")
+    for name in ("score", "valid", "memory", "action", "plan"):
+        stats = summary[name]
+        console.print(
+            f"[bold]{name.capitalize()}:[/bold] mean {stats['mean']:.3f} "
+            f"(95% CI {stats['ci_low']:.3f}-{stats['ci_high']:.3f}, "
+            f"std {stats['std']:.3f}, n={stats['n']})"
+        )
+    if summary["failed"]:
+        console.print(f"{summary['failed']} examples failed to evaluate", style="yellow")
+
+def _apply_file_batch(file_ops, shell) -> str:
+    """Confirm and apply consecutive file operations; return the observation text."""
+    for path, _, mode in file_ops:
+        console.print(f"File operation ({mode}): {path}", style="magenta")
+    confirm = input(f"Apply {len(file_ops)} file operation(s)? [y/N] ").strip().lower()
+    if confirm != 'y':
+        return "File operations aborted by user.\n"
+    results = apply_file_operations(file_ops, base_dir=shell.getcwd())
+    return "".join(f"{file_result}\n" for file_result in results)
+
 @app.command()
 def run(
     task: str = typer.Argument(..., help="The task to perform"),
     model: str = typer.Option("deepseek/deepseek-chat", help="The model to use"),
+    config: str = typer.Option(None, help="JSON routing config with per-module model settings (agent, rater, proposer)"),
+    rater_model: str = typer.Option(None, help="Model for the rater (default: same as --model)"),
+    max_retries: int = typer.Option(2, help="Model retries when output XML fails validation"),
+    command_timeout: float = typer.Option(30, help="Seconds before a command is interrupted"),
+    max_output: int = typer.Option(20000, help="Maximum characters of command output to keep"),
 ):
     """Run the DSPy agent with a unified module for memory, planning, and execution."""
     import dspy
@@ -91,8 +174,10 @@ def run(
 
     # Configure DSPy with the language model
     from .config import configure_lm
-    configure_lm(model)
-    unified_module = UnifiedModule()
+    configure_lm(model, config_path=config, rater_model=rater_model)
+    unified_module = UnifiedModule(max_retries=max_retries)
+    # One shell for the whole run so cd, exports and venvs carry over
+    shell = ShellSession(timeout=command_timeout, max_output=max_output)
 
     # Initial state
     memory = ""
@@ -103,116 +188,140 @@ def run(
     iteration = 1
     is_done = False
 
-    while not is_done:
-        console.print(f"\nLoop iteration {iteration}", style="bold")
-        iteration += 1
-
-        # Construct the input XML
-        input_xml = f"""
-        <agent_state>
-            <memory>{memory}</memory>
-            <last_plan>{last_plan}</last_plan>
-            <last_action>{last_action}</last_action>
-            <observation>{observation}</observation>
-        </agent_state>
-        """
-
-        # Get the output XML from the unified module
-        console.print(f"Input XML: {input_xml}", flush=True)
-        output_xml = unified_module(input_xml)
-        console.print(f"Output XML: {output_xml}")
+    try:
+        while not is_done:
+            console.print(f"\nLoop iteration {iteration}", style="bold")
+            iteration += 1
+
+            # Construct the input XML
+            input_xml = f"""
+            <agent_state>
+                <memory>{memory}</memory>
+                <last_plan>{last_plan}</last_plan>
+                <last_action>{last_action}</last_action>
+                <observation>{observation}</observation>
+            </agent_state>
+            """
+
+            # Get the output XML from the unified module
+            console.print(f"Input XML: {input_xml}", flush=True)
+            output_xml = unified_module(input_xml)
+            console.print(f"Output XML: {output_xml}")
         
-        # Log validation status
-        is_valid, error = unified_module.validate_xml(output_xml)
-        if not is_valid:
-            console.print(f"Warning: Output XML validation failed: {error}", style="yellow")
-
-        # Parse the output XML
-        try:
-            root = ET.fromstring(output_xml)
-            updated_memory = root.find("updated_memory").text or ""
+            # Log validation status
+            is_valid, error = unified_module.validate_xml(output_xml)
+            if not is_valid:
+                console.print(f"Warning: Output XML validation failed: {error}", style="yellow")
+
+            # Parse the output XML
+            try:
+                # Output is a fragment of agent_output children, as in validate_xml
+                root = ET.fromstring(f"<agent_output>{output_xml}</agent_output>")
+                updated_memory = root.find("updated_memory").text or ""
             
-            # Get the plan as XML string
-            new_plan_elem = root.find("new_plan")
-            new_plan = ET.tostring(new_plan_elem, encoding='unicode') if new_plan_elem is not None else "<plan></plan>"
+                # Get the plan as XML string
+                new_plan_elem = root.find("new_plan")
+                new_plan = ET.tostring(new_plan_elem, encoding='unicode') if new_plan_elem is not None else "<plan></plan>"
             
-            # Get the execution instructions
-            exec_instructions_elem = root.find("execution_instructions")
-            execution_instructions = ET.tostring(exec_instructions_elem, encoding='unicode') if exec_instructions_elem is not None else ""
+                # Get the execution instructions
+                exec_instructions_elem = root.find("execution_instructions")
+                execution_instructions = ET.tostring(exec_instructions_elem, encoding='unicode') if exec_instructions_elem is not None else ""
             
-            # Check if task is done
-            is_done_element = root.find("is_done")
-            is_done = is_done_element is not None and is_done_element.text.lower() == "true"
+                # Check if task is done
+                is_done_element = root.find("is_done")
+                is_done = is_done_element is not None and is_done_element.text.lower() == "true"
             
-            # Extract operations for potential execution
-            operations = []
-            write_ops = root.find(".//write_operations")
-            if write_ops is not None:
-                for op in write_ops.findall("operation"):
-                    op_type = op.get("type")
-                    if op_type == "command":
-                        cmd = op.get("command") or op.text
-                        operations.append(("command", cmd))
-                    elif op_type == "file":
-                        path = op.get("path")
-                        content = op.text or ""
-                        operations.append(("file", path, content))
-                    elif op_type == "message":
-                        operations.append(("message", op.text or ""))
+                # Extract operations for potential execution
+                operations = []
+                write_ops = root.find(".//write_operations")
+                if write_ops is not None:
+                    for op in write_ops.findall("operation"):
+                        op_type = op.get("type")
+                        if op_type == "command":
+                            cmd = op.get("command") or op.text
+                            operations.append(("command", cmd))
+                        elif op_type == "file":
+                            path = op.get("path")
+                            content = op.text or ""
+                            mode = op.get("mode", "write")
+                            if mode == "patch":
+                                # Diff lines start with a space; only trim blank edges
+                                content = content.strip("\n")
+                            operations.append(("file", path, content, mode))
+                        elif op_type == "message":
+                            operations.append(("message", op.text or ""))
             
-        except Exception as e:
-            console.print(f"Error parsing output XML: {e}", style="bold red")
-            console.print(f"Output received: {output_xml}", style="red")
-            break
-
-        # Update the state for the next iteration
-        memory = updated_memory
-        last_plan = new_plan
-        last_action = "executed_instructions"  # Could parse from execution_instructions
-
-        # Display the results
-        console.print(f"Memory: {memory}", style="blue")
-        console.print(f"Plan: {new_plan}", style="green")
-        console.print(f"Execution Instructions: {execution_instructions}", style="yellow")
+            except Exception as e:
+                console.print(f"Error parsing output XML: {e}", style="bold red")
+                console.print(f"Output received: {output_xml}", style="red")
+                break
+
+            # Update the state for the next iteration
+            memory = updated_memory
+            last_plan = new_plan
+            last_action = "executed_instructions"  # Could parse from execution_instructions
+
+            # Display the results
+            console.print(f"Memory: {memory}", style="blue")
+            console.print(f"Plan: {new_plan}", style="green")
+            console.print(f"Execution Instructions: {execution_instructions}", style="yellow")
         
-        # Process operations
-        observation = ""
-        for op in operations:
-            if op[0] == "message":
-                console.print(f"Message: {op[1]}", style="cyan")
-            elif op[0] == "command":
-                console.print(f"\nExecuting: {op[1]}", style="bold magenta")
-                console.print("WARNING: Executing arbitrary commands can be dangerous!", style="red")
-                
-                # Confirm execution
-                confirm = input("Proceed with execution? [y/N] ").strip().lower()
-                if confirm != 'y':
-                    observation += f"Command execution aborted by user: {op[1]}\n"
+            # Process operations
+            observation = ""
+            file_ops = []  # consecutive file operations, applied as one batch
+            for op in operations:
+                if op[0] == "file":
+                    file_ops.append(op[1:])
                     continue
+                # Write pending files first so later commands see them
+                if file_ops:
+                    observation += _apply_file_batch(file_ops, shell)
+                    file_ops = []
+                if op[0] == "message":
+                    console.print(f"Message: {op[1]}", style="cyan")
+                elif op[0] == "command":
+                    console.print(f"\nExecuting: {op[1]}", style="bold magenta")
+                    console.print("WARNING: Executing arbitrary commands can be dangerous!", style="red")
                 
-                try:
-                    result = subprocess.run(
-                        op[1], 
-                        shell=True,
-                        capture_output=True,
-                        text=True,
-                        timeout=30
-                    )
-                    observation += f"Command output:\n{result.stdout}\n"
-                    if result.stderr:
-                        observation += f"Errors:\n{result.stderr}\n"
-                except subprocess.TimeoutExpired:
-                    observation += f"Command timed out: {op[1]}\n"
-                except Exception as e:
-                    observation += f"Command failed: {str(e)}\n"
-            elif op[0] == "file":
-                console.print(f"Would write to file {op[1]}", style="magenta")
-                # TODO: Actually write to the file
-                observation += f"File '{op[1]}' would be written.\n"
-        
-        if not observation:
-            observation = f"Processed observation from iteration {iteration}"
+                    # Confirm execution
+                    confirm = input("Proceed with execution? [y/N] ").strip().lower()
+                    if confirm != 'y':
+                        observation += f"Command execution aborted by user: {op[1]}\n"
+                        continue
+                
+                    try:
+                        result = shell.run(op[1])
+                        observation += f"Command output:\n{result.output}\n"
+                        if result.timed_out:
+                            observation += f"Command timed out: {op[1]}\n"
+                        elif result.exit_code:
+                            observation += f"Exit status: {result.exit_code}\n"
+                    except Exception as e:
+                        observation += f"Command failed: {str(e)}\n"
 
+            if file_ops:
+                observation += _apply_file_batch(file_ops, shell)
+
+            if not observation:
+                observation = f"Processed observation from iteration {iteration}"
+    finally:
+        # Also on Ctrl-C or LM errors, so the session's children don't outlive us
+        shell.close()
+
+    stats = unified_module.repair_stats
+    console.print(
+        f"XML repair: {stats.valid_first_try} valid, {stats.repaired_locally} repaired locally, "
+        f"{stats.repaired_by_retry} repaired by retry ({stats.retries} retries), "
+        f"{stats.failed} failed, success rate {stats.success_rate:.0%}"
+    )
+    from .config import get_token_budget
+    for route in ("agent", "rater"):
+        budget = get_token_budget(route)
+        if budget is not None and budget.calls:
+            console.print(
+                f"Output tokens ({route}): budget {budget.suggest()}, {budget.calls} calls, "
+                f"{budget.truncations} truncated, {budget.continuations} continuations"
+            )
     console.print("\nAgent run completed", style="bold green")
 
 if __name__ == "__main__":
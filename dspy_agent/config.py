@@ -1,13 +1,220 @@
+import json
+import threading
 import dspy
+from dspy.clients.backend_selection import select_backend
+from dspy.clients.engines.lm15_engine import LM15Engine
+from dspy.lm15 import RouterConfig
+from .budget import CONTINUE_PROMPT, TokenBudget, estimate_tokens, is_truncated
 
-def configure_lm(model_name: str = "deepseek/deepseek-chat") -> None:
-    """Centralized language model configuration"""
+# Modules that can be routed to their own model
+ROUTES = ("agent", "rater", "proposer")
+
+DEFAULT_ROUTE_SETTINGS = {
+    "max_tokens": 1000,
+    "max_concurrency": 8,
+    "adaptive_max_tokens": True,
+    "max_continuations": 2,
+}
+
+_route_lms = {}
+_route_limits = {}
+_route_budgets = {}
+_shared_engine = None
+# (finish_reason, completion_tokens) of the calling thread's last LM call
+_last_completion = threading.local()
+
+# Routes whose output is XML, where an unclosed element signals truncation
+XML_ROUTES = ("agent",)
+
+
+def _finish_reason(response):
+    """finish_reason of a native lm15 Response or an OpenAI-shaped response."""
+    if isinstance(response, (list, tuple)):
+        response = response[0] if response else None
+    if hasattr(response, "finish_reason"):
+        return response.finish_reason
+    choices = getattr(response, "choices", None)
+    return getattr(choices[0], "finish_reason", None) if choices else None
+
+
+class SharedEngine(LM15Engine):
+    """Native lm15 engine shared by every route, so they draw on one connection pool.
+
+    Its router builds one transport for all providers. Copies of an LM keep
+    using the same engine instead of trying to copy its locks and sockets.
+    """
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class RoutedLM(dspy.LM):
+    """dspy.LM that caps concurrent calls for its route and sizes max_tokens adaptively.
+
+    The semaphore, token budget and per-thread completion info live at module
+    level rather than on the instance because dspy deep-copies LMs, and locks
+    and thread-locals can't be copied.
+    """
+
+    def __init__(self, model: str, route: str, max_continuations: int = 2, **kwargs):
+        super().__init__(model, **kwargs)
+        self.route = route
+        self.max_continuations = max_continuations
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        limit = _route_limits.get(self.route)
+        if limit is None:
+            return self._call_with_budget(prompt, messages, **kwargs)
+        with limit:
+            return self._call_with_budget(prompt, messages, **kwargs)
+
+    def update_history(self, entry):
+        """Record the call, and its finish_reason and completion tokens for this thread.
+
+        dspy calls this in the calling thread right after each completion,
+        unless history is disabled; the budget then falls back to estimates.
+        """
+        super().update_history(entry)
+        _last_completion.info = (
+            _finish_reason(entry.get("response")),
+            (entry.get("usage") or {}).get("completion_tokens"),
+        )
+
+    def _complete(self, **kwargs):
+        """Call the LM and return (outputs, finish_reason, completion_tokens)."""
+        _last_completion.info = (None, None)
+        outputs = super().__call__(**kwargs)
+        return outputs, *_last_completion.info
+
+    def _call_with_budget(self, prompt, messages, **kwargs):
+        budget = _route_budgets.get(self.route)
+        if budget is None or "max_tokens" in kwargs:
+            return super().__call__(prompt=prompt, messages=messages, **kwargs)
+
+        kwargs["max_tokens"] = budget.suggest()
+        outputs, finish_reason, tokens = self._complete(
+            prompt=prompt, messages=messages, **kwargs
+        )
+        if len(outputs) != 1 or not isinstance(outputs[0], str):
+            return outputs
+
+        text = outputs[0]
+        total_tokens = tokens or estimate_tokens(text)
+        # Only the agent's output is XML; rater reasoning may mention tags
+        expect_xml = self.route in XML_ROUTES
+        truncated = is_truncated(text, finish_reason, expect_xml)
+        was_truncated = truncated
+        messages = messages or [{"role": "user", "content": prompt}]
+        continuations = 0
+        # Continue a cut-off output instead of regenerating it
+        while truncated and continuations < self.max_continuations:
+            continuations += 1
+            kwargs["max_tokens"] = budget.ceiling
+            more, finish_reason, tokens = self._complete(
+                messages=messages + [
+                    {"role": "assistant", "content": text},
+                    {"role": "user", "content": CONTINUE_PROMPT},
+                ],
+                **kwargs,
+            )
+            text += more[0]
+            total_tokens += tokens or estimate_tokens(more[0])
+            truncated = is_truncated(text, finish_reason, expect_xml)
+
+        budget.record(total_tokens, was_truncated, continuations)
+        return [text]
+
+
+def resolve_model_name(model_name: str) -> str:
+    """Expand model aliases."""
     # Special case for "flash" to use OpenRouter Gemini Flash
     if model_name.lower() == "flash":
-        model_name = "openrouter/google/gemini-2.0-flash-001"
-    
-    lm = dspy.LM(model_name, 
-            cache=False, 
-            max_tokens=1000,
+        return "openrouter/google/gemini-2.0-flash-001"
+    return model_name
+
+
+def load_routes(
+    model_name: str = "deepseek/deepseek-chat",
+    config_path: str = None,
+    rater_model: str = None,
+    proposer_model: str = None,
+) -> dict:
+    """Build per-route LM settings.
+
+    Every route starts from ``model_name`` and the defaults. A JSON config
+    file can then set any route, e.g.
+    ``{"rater": {"model": "flash", "max_tokens": 300, "max_concurrency": 16}}``;
+    extra keys are passed to ``dspy.LM``. ``rater_model`` and
+    ``proposer_model`` override the file.
+    """
+    routes = {
+        route: {"model": model_name, **DEFAULT_ROUTE_SETTINGS} for route in ROUTES
+    }
+    if config_path:
+        with open(config_path, encoding="utf-8") as f:
+            file_routes = json.load(f)
+        unknown = set(file_routes) - set(ROUTES)
+        if unknown:
+            raise ValueError(
+                f"Unknown routes in {config_path}: {', '.join(sorted(unknown))}"
             )
-    dspy.settings.configure(lm=lm)
+        for route, settings in file_routes.items():
+            routes[route].update(settings)
+    if rater_model:
+        routes["rater"]["model"] = rater_model
+    if proposer_model:
+        routes["proposer"]["model"] = proposer_model
+    return routes
+
+
+def configure_routes(routes: dict) -> None:
+    """Create one LM per route and install the agent route globally.
+
+    Routes that dspy would run on its native engine, and that set no client
+    options of their own (api_key, api_base, ...), share one engine sized for
+    the combined ``max_concurrency`` of all routes.
+    """
+    global _shared_engine
+    _shared_engine = SharedEngine(
+        RouterConfig(
+            max_connections=sum(settings.get("max_concurrency") or 1 for settings in routes.values())
+        )
+    )
+    _route_lms.clear()
+    _route_limits.clear()
+    _route_budgets.clear()
+    for route, settings in routes.items():
+        settings = dict(settings)
+        model = resolve_model_name(settings.pop("model"))
+        max_concurrency = settings.pop("max_concurrency", None)
+        if max_concurrency:
+            _route_limits[route] = threading.BoundedSemaphore(max_concurrency)
+        if settings.pop("adaptive_max_tokens", False):
+            _route_budgets[route] = TokenBudget(ceiling=settings.get("max_tokens", 1000))
+        settings.setdefault("cache", False)
+        lm = RoutedLM(model, route, **settings)
+        selection = select_backend(lm)
+        if selection.native and not selection.clients:
+            lm = lm.copy(engine=_shared_engine)
+        _route_lms[route] = lm
+    dspy.settings.configure(lm=_route_lms["agent"])
+
+
+def get_token_budget(route: str):
+    """Adaptive token budget for ``route``, or None if it uses a fixed max_tokens."""
+    return _route_budgets.get(route)
+
+
+def get_lm(route: str):
+    """LM configured for ``route``, or None to use the global LM."""
+    return _route_lms.get(route)
+
+
+def configure_lm(
+    model_name: str = "deepseek/deepseek-chat",
+    config_path: str = None,
+    rater_model: str = None,
+    proposer_model: str = None,
+) -> None:
+    """Centralized language model configuration"""
+    configure_routes(load_routes(model_name, config_path, rater_model, proposer_model))
@@ -0,0 +1,199 @@
+import dspy
+import hashlib
+import json
+import math
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from rich.console import Console
+from .config import configure_routes, load_routes, resolve_model_name
+from .unified import UnifiedModule, UnifiedTask
+
+console = Console()
+
+CRITERIA = ("memory", "action", "plan")
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def example_hash(example: dict) -> str:
+    """Stable hash of the example fields that affect its score."""
+    return hash_text(json.dumps(
+        {"input_xml": example["input_xml"], "output_xml": example.get("output_xml", "")},
+        sort_keys=True,
+    ))
+
+
+def summarize(values: list) -> dict:
+    """Mean, standard deviation and 95% confidence interval (normal approximation)."""
+    n = len(values)
+    if not n:
+        return {"n": 0, "mean": 0.0, "std": 0.0, "ci_low": 0.0, "ci_high": 0.0}
+    mean = sum(values) / n
+    std = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1)) if n > 1 else 0.0
+    margin = 1.96 * std / math.sqrt(n)
+    return {"n": n, "mean": mean, "std": std, "ci_low": mean - margin, "ci_high": mean + margin}
+
+
+class ResultStore:
+    """SQLite store of per-example scores keyed by program and example hash."""
+
+    def __init__(self, path: str = "evaluation_results.db"):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                program_hash TEXT NOT NULL,
+                example_hash TEXT NOT NULL,
+                score REAL NOT NULL,
+                is_valid INTEGER NOT NULL,
+                memory INTEGER,
+                action INTEGER,
+                plan INTEGER,
+                output_xml TEXT,
+                PRIMARY KEY (program_hash, example_hash)
+            )"""
+        )
+        self.connection.commit()
+
+    def get(self, program_hash: str) -> dict:
+        """All stored results for a program version, keyed by example hash."""
+        rows = self.connection.execute(
+            "SELECT example_hash, score, is_valid, memory, action, plan FROM results "
+            "WHERE program_hash = ?",
+            (program_hash,),
+        )
+        return {
+            row[0]: {
+                "score": row[1],
+                "is_valid": bool(row[2]),
+                "memory": row[3],
+                "action": row[4],
+                "plan": row[5],
+            }
+            for row in rows
+        }
+
+    def put(self, program_hash: str, example_hash: str, result: dict):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                program_hash,
+                example_hash,
+                result["score"],
+                int(result["is_valid"]),
+                result["memory"],
+                result["action"],
+                result["plan"],
+                result.get("output_xml", ""),
+            ),
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class Evaluator:
+    """Scores a saved program against a dataset, reusing stored results."""
+
+    def __init__(
+        self,
+        model_name: str = "deepseek/deepseek-chat",
+        config_path: str = None,
+        rater_model: str = None,
+        store_path: str = "evaluation_results.db",
+        num_threads: int = 8,
+        max_retries: int = 2,
+    ):
+        self.routes = load_routes(model_name, config_path=config_path, rater_model=rater_model)
+        configure_routes(self.routes)
+        self.store_path = store_path
+        self.num_threads = num_threads
+        self.max_retries = max_retries
+
+    def _program_hash(self, program_path: str) -> str:
+        """Version of the program: its saved state, the agent and rater route
+        settings, and the XML retry budget."""
+        with open(program_path, encoding="utf-8") as f:
+            program_state = f.read()
+        routes = {
+            route: dict(self.routes[route], model=resolve_model_name(self.routes[route]["model"]))
+            for route in ("agent", "rater")
+        }
+        return hash_text(json.dumps([program_state, routes, self.max_retries], sort_keys=True))
+
+    def _load_dataset(self, data_path: str) -> list:
+        if not os.path.exists(data_path):
+            console.print(f"Error: Dataset file '{data_path}' not found", style="bold red")
+            raise FileNotFoundError(f"Dataset not found at {data_path}")
+        with open(data_path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _score_example(self, module: UnifiedModule, example: dict) -> dict:
+        """Same scoring as the optimizer metric, with a single rater call."""
+        output_xml = module(example["input_xml"])
+        is_valid, _ = module.validate_xml(output_xml)
+        ratings = module.rating_module.get_detailed_ratings(
+            pipeline_input=example["input_xml"], pipeline_output=output_xml
+        )
+        if "error" in ratings:
+            # Placeholder scores; don't cache them, retry on the next run
+            raise ValueError(f"Could not parse rater output: {ratings['error']}")
+        scores = {criterion: ratings[criterion]["score"] for criterion in CRITERIA}
+        rating = sum(scores.values()) / len(scores) / 9.0
+        return {
+            "score": (float(is_valid) + rating) / 2.0,
+            "is_valid": is_valid,
+            "output_xml": output_xml,
+            **scores,
+        }
+
+    def evaluate(self, program_path: str, data_path: str) -> dict:
+        """Evaluate examples without a stored result and summarize all of them."""
+        examples = self._load_dataset(data_path)
+        program_hash = self._program_hash(program_path)
+        predictor = dspy.Predict(UnifiedTask)
+        predictor.load(program_path)
+        module = UnifiedModule(predictor, max_retries=self.max_retries)
+
+        store = ResultStore(self.store_path)
+        try:
+            stored = store.get(program_hash)
+            hashes = [example_hash(example) for example in examples]
+            pending = {h: ex for h, ex in zip(hashes, examples) if h not in stored}
+            console.print(
+                f"{len(examples) - len(pending)} cached, {len(pending)} to evaluate",
+                style="bold",
+            )
+
+            failed = 0
+            with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+                futures = {
+                    executor.submit(self._score_example, module, example): h
+                    for h, example in pending.items()
+                }
+                for future in as_completed(futures):
+                    h = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        failed += 1
+                        console.print(f"Evaluation failed: {e}", style="red")
+                        continue
+                    store.put(program_hash, h, result)
+                    stored[h] = result
+        finally:
+            store.close()
+
+        results = [stored[h] for h in hashes if h in stored]
+        summary = {
+            "program_hash": program_hash,
+            "failed": failed,
+            "score": summarize([r["score"] for r in results]),
+            "valid": summarize([float(r["is_valid"]) for r in results]),
+        }
+        for criterion in CRITERIA:
+            summary[criterion] = summarize([r[criterion] for r in results])
+        return summary
@@ -0,0 +1,182 @@
+"""Batched, atomic application of agent file operations."""
+import hashlib
+import os
+import re
+import tempfile
+
+HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(ValueError):
+    """Raised when a patch does not apply to the current file content."""
+
+
+class FileResult:
+    """Outcome of the operations applied to one path."""
+
+    def __init__(self, path: str, status: str, message: str = ""):
+        self.path = path
+        self.status = status  # "written", "unchanged" or "failed"
+        self.message = message
+
+    def __str__(self) -> str:
+        text = f"File '{self.path}' {self.status}"
+        return f"{text}: {self.message}" if self.message else text
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def apply_patch(original: str, patch: str) -> str:
+    """Apply a unified diff to ``original`` and return the new content.
+
+    Hunks are located by their context lines, searching outwards from the
+    line number in the hunk header, so small offsets are tolerated.
+    """
+    lines = original.splitlines()
+    patch_lines = patch.splitlines()
+    # Drop trailing blank lines, e.g. the indentation before </operation>
+    while patch_lines and not patch_lines[-1].strip():
+        patch_lines.pop()
+    hunks = []
+    current = None
+    for line in patch_lines:
+        match = HUNK_RE.match(line)
+        if match:
+            current = (int(match.group(1)), [], [])
+            hunks.append(current)
+        elif current is None or line.startswith("\\"):
+            continue  # file headers and "\ No newline at end of file"
+        elif line.startswith("-"):
+            current[1].append(line[1:])
+        elif line.startswith("+"):
+            current[2].append(line[1:])
+        else:
+            # Context lines; tolerate a stripped leading space on empty lines
+            current[1].append(line[1:])
+            current[2].append(line[1:])
+    if not hunks:
+        raise PatchError("no hunks found in patch")
+
+    offset = 0
+    for start, old, new in hunks:
+        expected = max(start - 1 + offset, 0)
+        position = _find_block(lines, old, expected)
+        if position is None:
+            raise PatchError(f"hunk at line {start} does not match file content")
+        lines[position:position + len(old)] = new
+        offset += len(new) - len(old)
+
+    result = "\n".join(lines)
+    if lines and (original.endswith("\n") or not original):
+        result += "\n"
+    return result
+
+
+def _find_block(lines: list[str], block: list[str], expected: int):
+    if not block:
+        return min(expected, len(lines))
+    for distance in range(len(lines) + 1):
+        for position in (expected - distance, expected + distance):
+            if 0 <= position <= len(lines) - len(block) and lines[position:position + len(block)] == block:
+                return position
+    return None
+
+
+def apply_file_operations(operations, base_dir: str = None) -> list[FileResult]:
+    """Apply a batch of ``(path, content, mode)`` file operations.
+
+    Operations on the same path are applied in order in memory. Each
+    resulting file is written to a temporary file and renamed into place;
+    files whose content hash already matches the disk are skipped. All
+    temporary files are fsynced before any rename, and each directory is
+    fsynced once after the renames.
+    """
+    base_dir = base_dir or os.getcwd()
+    pending = {}  # absolute path -> [display path, original bytes or None, new text]
+    failed = set()
+    results = []
+    for path, content, mode in operations:
+        if not path:
+            results.append(FileResult("", "failed", "missing path attribute"))
+            continue
+        # Resolve symlinks so the rename replaces the target, not the link
+        full_path = os.path.realpath(os.path.join(base_dir, os.path.expanduser(path)))
+        if full_path in failed:
+            continue
+        if full_path not in pending:
+            try:
+                with open(full_path, "rb") as f:
+                    original = f.read()
+                text = original.decode("utf-8")
+            except FileNotFoundError:
+                original, text = None, ""
+            except (OSError, UnicodeDecodeError) as e:
+                failed.add(full_path)
+                results.append(FileResult(path, "failed", str(e)))
+                continue
+            pending[full_path] = [path, original, text]
+        entry = pending[full_path]
+        try:
+            if mode == "patch":
+                entry[2] = apply_patch(entry[2], content)
+            elif mode == "append":
+                entry[2] += content
+            else:
+                entry[2] = content
+        except PatchError as e:
+            failed.add(full_path)
+            results.append(FileResult(path, "failed", str(e)))
+            del pending[full_path]
+
+    staged = []
+    umask = os.umask(0)
+    os.umask(umask)
+    for full_path, (path, original, text) in pending.items():
+        data = text.encode("utf-8")
+        if original is not None and content_hash(original) == content_hash(data):
+            results.append(FileResult(path, "unchanged"))
+            continue
+        tmp_path = None
+        try:
+            directory = os.path.dirname(full_path)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".dspy_agent_")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            if original is not None:
+                perms = os.stat(full_path).st_mode & 0o7777
+            else:
+                perms = 0o666 & ~umask
+            os.chmod(tmp_path, perms)
+            staged.append((path, full_path, tmp_path, len(data)))
+        except OSError as e:
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            results.append(FileResult(path, "failed", str(e)))
+
+    directories = set()
+    for path, full_path, tmp_path, size in staged:
+        try:
+            os.replace(tmp_path, full_path)
+            directories.add(os.path.dirname(full_path))
+            results.append(FileResult(path, "written", f"{size} bytes"))
+        except OSError as e:
+            os.unlink(tmp_path)
+            results.append(FileResult(path, "failed", str(e)))
+
+    for directory in directories:
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            continue  # e.g. platforms that can't open directories
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+    return results
@@ -2,7 +2,7 @@ import dspy
 import json
 import os
 from rich.console import Console
-from .config import configure_lm
+from .config import configure_routes, get_lm, load_routes
 from .unified import UnifiedModule, UnifiedTask
 from .rating import RatingModule
 from .schema import INPUT_XML_SCHEMA, OUTPUT_XML_SCHEMA
@@ -11,6 +11,37 @@ from dspy.teleprompt import BootstrapFewShotWithRandomSearch, MIPROv2
 console = Console()
 
 
+def score_output(input_xml: str, output_xml: str, rating_module: RatingModule) -> float:
+    """Combine XML validity and quality ratings into a 0-1 score."""
+    # Validate XML structure
+    is_valid, error = UnifiedModule().validate_xml(output_xml)
+    score_raw = 0.0
+    if is_valid:
+        score_raw += 1
+    else:
+        console.print(f"[red]XML Validation Failed:[/red] {error}", style="red")
+
+    # Get detailed ratings with reasoning
+    detailed_ratings = rating_module.get_detailed_ratings(
+        pipeline_input=input_xml, pipeline_output=output_xml
+    )
+
+    # Print detailed ratings
+    console.print("[bold]Detailed Ratings:[/bold]")
+    for criterion, rating in detailed_ratings.items():
+        if criterion != "error":
+            console.print(
+                f"[bold]{criterion.capitalize()}:[/bold] {rating['score']}/9"
+            )
+            console.print(f"  Reasoning: {rating['reasoning']}")
+
+    # Calculate quality rating
+    score_rating_module = (
+        rating_module(pipeline_input=input_xml, pipeline_output=output_xml) / 9.0
+    )  # Normalize to 0-1
+    return (score_raw + score_rating_module) / 2.0
+
+
 class Optimizer:
     """Handles model optimization workflow"""
 
@@ -18,8 +49,31 @@ class Optimizer:
         self,
         model_name: str = "deepseek/deepseek-chat",
         optimizer_type: str = "bootstrap",
+        config_path: str = None,
+        rater_model: str = None,
+        proposer_model: str = None,
+        workers: int = 0,
+        queue_dir: str = None,
+        num_threads: int = None,
+        job_timeout: float = 600,
     ):
+        if optimizer_type == "bootstrap" and (workers or queue_dir):
+            # BootstrapFewShot calls the metric one example at a time, so
+            # workers would only add queue round trips
+            raise ValueError(
+                "Worker mode needs an optimizer that evaluates in parallel "
+                "(random_search or mipro), not bootstrap"
+            )
         self.model_name = model_name
+        self.config_path = config_path
+        self.rater_model = rater_model
+        self.proposer_model = proposer_model
+        self.workers = workers
+        self.queue_dir = queue_dir
+        # Threads only wait on worker results in worker mode, so use plenty
+        self.num_threads = num_threads or (2 * workers if workers else None)
+        self.job_timeout = job_timeout
+        self.coordinator = None
         self.rating_module = RatingModule()
         self.optimizer = None
         self.optimizer_type = optimizer_type
@@ -34,6 +88,7 @@ class Optimizer:
                 max_bootstrapped_demos=8,
                 max_labeled_demos=8,
                 num_candidate_programs=5,
+                num_threads=self.num_threads,
             )
         elif optimizer_type == "mipro":
             self.optimizer = MIPROv2(
@@ -41,7 +96,9 @@ class Optimizer:
                 max_bootstrapped_demos=0,
                 max_labeled_demos=0,
                 auto="light",
-                num_threads=1,
+                num_threads=self.num_threads or 1,
+                prompt_model=get_lm("proposer"),
+                task_model=get_lm("agent"),
             )
         else:  # default bootstrap
             self.optimizer = dspy.BootstrapFewShot(
@@ -56,37 +113,14 @@ class Optimizer:
         console.print(f"example: {example}")
         console.print(f"pred: {pred}")
         console.print(f"Generated XML: {pred.output_xml}")
-        # Validate XML structure
-        is_valid, error = UnifiedModule().validate_xml(pred.output_xml)
-        score_raw = 0.0
-        if is_valid:
-            score_raw += 1
-        else:
-            console.print(f"[red]XML Validation Failed:[/red] {error}", style="red")
-
-        # Get detailed ratings with reasoning
-        detailed_ratings = self.rating_module.get_detailed_ratings(
-            pipeline_input=example.input_xml, pipeline_output=pred.output_xml
-        )
-
-        # Print detailed ratings
-        console.print("[bold]Detailed Ratings:[/bold]")
-        for criterion, rating in detailed_ratings.items():
-            if criterion != "error":
-                console.print(
-                    f"[bold]{criterion.capitalize()}:[/bold] {rating['score']}/9"
-                )
-                console.print(f"  Reasoning: {rating['reasoning']}")
-
-        # Calculate quality rating
-        score_rating_module = (
-            self.rating_module(
-                pipeline_input=example.input_xml, pipeline_output=pred.output_xml
-            )
-            / 9.0
-        )  # Normalize to 0-1
-        score = (score_raw + score_rating_module) / 2.0
-        return score
+        if self.coordinator is not None:
+            # Validation and rating run in a worker process
+            return self.coordinator.map(
+                "metric",
+                [{"input_xml": example.input_xml, "output_xml": pred.output_xml}],
+                timeout=self.job_timeout,
+            )[0]
+        return score_output(example.input_xml, pred.output_xml, self.rating_module)
 
     def _load_optimized_model(self) -> dspy.Predict:
         """Load optimized model weights if available."""
@@ -105,7 +139,13 @@ class Optimizer:
         """Centralized model configuration"""
         # Import moved to top of file to fix linting warning
 
-        configure_lm(self.model_name)
+        self.routes = load_routes(
+            self.model_name,
+            config_path=self.config_path,
+            rater_model=self.rater_model,
+            proposer_model=self.proposer_model,
+        )
+        configure_routes(self.routes)
 
     def _load_training_data(self, data_path: str):
         """Load training data from file"""
@@ -132,6 +172,22 @@ class Optimizer:
         """Run full optimization workflow"""
         train_data = self._load_training_data(training_data_path)
 
+        if self.workers or self.queue_dir:
+            from .workers import Coordinator
+
+            queue_dir = self.queue_dir or ".dspy_agent_queue"
+            if not self.workers:
+                console.print(
+                    f"No local workers started; jobs wait for `dspy-agent worker {queue_dir}` "
+                    f"(timeout {self.job_timeout:.0f}s per job)",
+                    style="yellow",
+                )
+            self.coordinator = Coordinator(
+                queue_dir,
+                workers=self.workers,
+                settings={"routes": self.routes},
+            )
+
         try:
             # Start with base predictor or pre-optimized version
             predictor = self._load_optimized_model() or dspy.Predict(UnifiedTask)
@@ -154,3 +210,7 @@ class Optimizer:
                 f"[bold red]Optimization Failed:[/bold red] {str(e)}", style="red"
             )
             raise
+        finally:
+            if self.coordinator is not None:
+                self.coordinator.close()
+                self.coordinator = None
@@ -1,4 +1,5 @@
 import dspy
+from .config import get_lm
 
 
 class RatingTask(dspy.Signature):
@@ -26,11 +27,16 @@ class RatingModule(dspy.Module):
         super().__init__()
         self.rater = dspy.Predict(RatingTask)
 
+    def _rate(self, pipeline_input: str, pipeline_output: str):
+        """Run the rater on its own route's LM, if one is configured."""
+        with dspy.settings.context(lm=get_lm("rater") or dspy.settings.lm):
+            return self.rater(
+                pipeline_input=pipeline_input, pipeline_output=pipeline_output
+            )
+
     def forward(self, pipeline_input: str, pipeline_output: str) -> float:
         """Rate the output and return the average score."""
-        result = self.rater(
-            pipeline_input=pipeline_input, pipeline_output=pipeline_output
-        )
+        result = self._rate(pipeline_input, pipeline_output)
         try:
             scores = [
                 int(result.added_all_relevant_information_to_memory_score),
@@ -46,9 +52,7 @@ class RatingModule(dspy.Module):
 
     def get_detailed_ratings(self, pipeline_input: str, pipeline_output: str) -> dict:
         """Get detailed ratings with reasoning."""
-        result = self.rater(
-            pipeline_input=pipeline_input, pipeline_output=pipeline_output
-        )
+        result = self._rate(pipeline_input, pipeline_output)
         try:
             return {
                 "memory": {
@@ -0,0 +1,142 @@
+"""Cheap local repairs for output XML that fails schema validation."""
+import re
+import xml.etree.ElementTree as ET
+from typing import Callable
+
+from .schema import OUTPUT_XML_SCHEMA
+
+XS = "{http://www.w3.org/2001/XMLSchema}"
+
+FENCE_RE = re.compile(r"^\s*```[a-zA-Z]*\s*\n?(.*?)\n?\s*```\s*$", re.DOTALL)
+WRAPPER_RE = re.compile(r"^\s*<agent_output>(.*)</agent_output>\s*$", re.DOTALL)
+STRAY_AMP_RE = re.compile(r"&(?!#\d+;|#x[0-9a-fA-F]+;|[a-zA-Z][a-zA-Z0-9]*;)")
+STRAY_LT_RE = re.compile(r"<(?![a-zA-Z_/!?])")
+TAG_RE = re.compile(r"<(/?)([a-zA-Z_][\w.\-]*)([^<>]*?)(/?)>")
+
+
+def _output_sequence() -> list[str]:
+    """Element names of agent_output in the order the schema requires."""
+    schema = ET.fromstring(OUTPUT_XML_SCHEMA)
+    sequence = schema.find(f"{XS}element/{XS}complexType/{XS}sequence")
+    return [el.get("name") for el in sequence.findall(f"{XS}element")]
+
+
+OUTPUT_SEQUENCE = _output_sequence()
+
+
+def strip_fences(xml_string: str) -> str:
+    """Remove a surrounding markdown code fence and a redundant agent_output wrapper."""
+    match = FENCE_RE.match(xml_string)
+    if match:
+        xml_string = match.group(1)
+    match = WRAPPER_RE.match(xml_string)
+    if match:
+        xml_string = match.group(1)
+    return xml_string.strip()
+
+
+def escape_stray_chars(xml_string: str) -> str:
+    """Escape '&' and '<' that do not start an entity or a tag."""
+    xml_string = STRAY_AMP_RE.sub("&amp;", xml_string)
+    return STRAY_LT_RE.sub("&lt;", xml_string)
+
+
+def balance_tags(xml_string: str) -> str:
+    """Close unclosed elements and drop closing tags that have no opener."""
+    out = []
+    stack = []
+    pos = 0
+    for match in TAG_RE.finditer(xml_string):
+        out.append(xml_string[pos:match.start()])
+        pos = match.end()
+        is_close, name, _, self_closing = match.groups()
+        if self_closing:
+            out.append(match.group(0))
+        elif not is_close:
+            stack.append(name)
+            out.append(match.group(0))
+        elif name in stack:
+            # Close any elements left open inside this one
+            while stack[-1] != name:
+                out.append(f"</{stack.pop()}>")
+            stack.pop()
+            out.append(match.group(0))
+        # else: unmatched closing tag, drop it
+    out.append(xml_string[pos:])
+    out.extend(f"</{name}>" for name in reversed(stack))
+    return "".join(out)
+
+
+def reorder_elements(xml_string: str) -> str:
+    """Reorder top-level elements to the OUTPUT_XML_SCHEMA sequence."""
+    try:
+        root = ET.fromstring(f"<agent_output>{xml_string}</agent_output>")
+    except ET.ParseError:
+        return xml_string
+    children = list(root)
+    rank = {name: i for i, name in enumerate(OUTPUT_SEQUENCE)}
+    children.sort(key=lambda el: rank.get(el.tag, len(rank)))
+    parts = []
+    for child in children:
+        child.tail = None
+        parts.append(ET.tostring(child, encoding="unicode"))
+    return "\n".join(parts)
+
+
+LOCAL_FIXES = [
+    ("strip_fences", strip_fences),
+    ("escape_stray_chars", escape_stray_chars),
+    ("balance_tags", balance_tags),
+    ("reorder_elements", reorder_elements),
+]
+
+
+def repair_xml(
+    xml_string: str, validate: Callable[[str], tuple[bool, str]]
+) -> tuple[str, bool, str, list[str]]:
+    """Apply local fixes cumulatively until the XML validates.
+
+    Returns the (possibly) repaired XML, whether it is valid, the last
+    validation error and the names of the fixes that changed the text.
+    """
+    applied = []
+    is_valid, error = validate(xml_string)
+    for name, fix in LOCAL_FIXES:
+        if is_valid:
+            break
+        fixed = fix(xml_string)
+        if fixed == xml_string:
+            continue
+        applied.append(name)
+        xml_string = fixed
+        is_valid, error = validate(xml_string)
+    return xml_string, is_valid, error, applied
+
+
+class RepairStats:
+    """Counts how output XML became valid (or didn't)."""
+
+    def __init__(self):
+        self.calls = 0
+        self.valid_first_try = 0
+        self.repaired_locally = 0
+        self.repaired_by_retry = 0
+        self.retries = 0
+        self.failed = 0
+
+    @property
+    def success_rate(self) -> float:
+        if not self.calls:
+            return 0.0
+        return (self.calls - self.failed) / self.calls
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "valid_first_try": self.valid_first_try,
+            "repaired_locally": self.repaired_locally,
+            "repaired_by_retry": self.repaired_by_retry,
+            "retries": self.retries,
+            "failed": self.failed,
+            "success_rate": self.success_rate,
+        }
@@ -66,6 +66,15 @@ EXECUTION_XML_SCHEMA = """
                 </xs:attribute>
                 <xs:attribute name="path" type="xs:string" />
                 <xs:attribute name="command" type="xs:string" />
+                <xs:attribute name="mode">
+                  <xs:simpleType>
+                    <xs:restriction base="xs:string">
+                      <xs:enumeration value="write" />
+                      <xs:enumeration value="append" />
+                      <xs:enumeration value="patch" />
+                    </xs:restriction>
+                  </xs:simpleType>
+                </xs:attribute>
               </xs:extension>
             </xs:simpleContent>
           </xs:complexType>
@@ -91,6 +100,27 @@ OUTPUT_XML_SCHEMA = """
           </xs:complexType>
         </xs:element>
         <xs:element name="execution_instructions">
+          <xs:annotation>
+            <xs:documentation>
+              A write_operations element holding operation elements, run in order.
+              type="command": shell command in the command attribute or the text.
+              type="message": text shown to the user.
+              type="file": file at the path attribute; the mode attribute is
+              "write" (default, text is the full content), "append" (text is added
+              to the end) or "patch" (text is a unified diff). Prefer patch for
+              small changes to large files instead of rewriting them, e.g.
+              <write_operations>
+                <operation type="file" path="app.py" mode="patch">
+@@ -10,3 +10,3 @@
+ def main():
+-    print("hello")
++    print("hello, world")
+     return 0
+                </operation>
+                <operation type="command">python app.py</operation>
+              </write_operations>
+            </xs:documentation>
+          </xs:annotation>
           <xs:complexType>
             <xs:sequence>
               <xs:any processContents="skip" />
@@ -143,6 +173,11 @@ EXAMPLE_EXECUTION_XML = """
   <operation type="command" command="ls -la">ls -la</operation>
   <operation type="message">Listing all files in the current directory</operation>
   <operation type="file" path="results.txt">Contents to write to the file</operation>
+  <operation type="file" path="results.txt" mode="patch">
+@@ -1 +1 @@
+-Contents to write to the file
++Updated contents of the file
+  </operation>
 </write_operations>
 """
 
@@ -0,0 +1,179 @@
+"""Long-lived shell session for executing agent commands."""
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import threading
+import time
+import uuid
+
+
+class CommandResult:
+    """Output and exit status of a single command run in a ShellSession."""
+
+    def __init__(self, output: str, exit_code, timed_out: bool = False, truncated: bool = False):
+        self.output = output
+        self.exit_code = exit_code
+        self.timed_out = timed_out
+        self.truncated = truncated
+
+
+class ShellSession:
+    """Keep one shell process alive so cwd, variables and environments persist.
+
+    Each command is passed to ``eval`` and followed by a sentinel line carrying
+    its exit status, so output can be framed without restarting the shell.
+    """
+
+    def __init__(
+        self,
+        shell: str = None,
+        timeout: float = 30,
+        max_output: int = 20000,
+        cwd: str = None,
+    ):
+        self.shell = shell or shutil.which("bash") or "/bin/sh"
+        self.timeout = timeout
+        self.max_output = max_output
+        self.cwd = cwd
+        self.process = None
+        self._lines = None
+        self._sentinel = None
+        self.commands_run = 0
+
+    def start(self):
+        """Start the shell if it isn't running."""
+        if self.is_alive():
+            return
+        self._sentinel = f"__DSPY_AGENT_{uuid.uuid4().hex}__"
+        self._lines = queue.Queue()
+        self.process = subprocess.Popen(
+            [self.shell],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+            cwd=self.cwd,
+            start_new_session=True,  # own process group, so timeouts can signal it
+        )
+        threading.Thread(
+            target=self._read_output, args=(self.process.stdout, self._lines), daemon=True
+        ).start()
+        # A trapped (not ignored) SIGINT keeps the shell alive on timeouts
+        # while children still get the default action.
+        self._write("trap : INT\n")
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    @staticmethod
+    def _read_output(stream, lines):
+        for line in iter(stream.readline, ""):
+            lines.put(line)
+        lines.put(None)
+
+    def _write(self, text: str):
+        self.process.stdin.write(text)
+        self.process.stdin.flush()
+
+    def run(self, command: str, timeout: float = None) -> CommandResult:
+        """Run a command in the session and return its framed output."""
+        self.start()
+        timeout = self.timeout if timeout is None else timeout
+        delimiter = f"{self._sentinel}_CMD"
+        self._write(
+            f"__dspy_agent_cmd=$(cat <<'{delimiter}'\n{command}\n{delimiter}\n)\n"
+            f'eval "$__dspy_agent_cmd" </dev/null\n'
+            f"printf '\\n{self._sentinel}%s\\n' \"$?\"\n"
+        )
+        self.commands_run += 1
+
+        chunks = []
+        size = 0
+        truncated = False
+        timed_out = False
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and not timed_out:
+                timed_out = True
+                self._interrupt()
+                deadline = time.monotonic() + 2  # grace period for the sentinel
+                continue
+            try:
+                line = self._lines.get(timeout=max(remaining, 0.01))
+            except queue.Empty:
+                if timed_out:
+                    # Command ignored SIGINT; only a fresh shell gets us back
+                    self.close()
+                    return CommandResult(
+                        self._join(chunks, truncated) + "Shell session restarted after timeout.\n",
+                        None,
+                        timed_out=True,
+                        truncated=truncated,
+                    )
+                continue
+            if line is None:
+                # The command ended the shell itself, e.g. `exit` or a failing `set -e`
+                self.close()
+                return CommandResult(
+                    self._join(chunks, truncated)
+                    + "Shell session exited; cwd and environment were reset.\n",
+                    None,
+                    timed_out,
+                    truncated,
+                )
+            if line.startswith(self._sentinel):
+                exit_code = int(line[len(self._sentinel):].strip())
+                output = self._join(chunks, truncated)
+                # Drop the newline printed in front of the sentinel
+                if output.endswith("\n") and not truncated:
+                    output = output[:-1]
+                return CommandResult(output, exit_code, timed_out, truncated)
+            kept = line[: max(self.max_output - size, 0)]
+            if kept:
+                chunks.append(kept)
+                size += len(kept)
+            if len(kept) < len(line):
+                truncated = True
+
+    def getcwd(self) -> str:
+        """Current directory of the session, so file paths match what commands see."""
+        if self.is_alive():
+            result = self.run("pwd")
+            if result.exit_code == 0 and result.output.strip():
+                return result.output.strip()
+        return self.cwd or os.getcwd()
+
+    def _join(self, chunks, truncated: bool) -> str:
+        output = "".join(chunks)
+        if truncated:
+            output += f"\n[output truncated to {self.max_output} characters]\n"
+        return output
+
+    def _interrupt(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGINT)
+        except ProcessLookupError:
+            pass
+
+    def close(self):
+        """Terminate the shell process."""
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.process.wait()
+        self.process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,8 +1,8 @@
 import dspy
 from rich.console import Console
 from .rating import RatingModule
-import xml.etree.ElementTree as ET
 from lxml import etree
+from .repair import RepairStats, repair_xml
 from .schema import INPUT_XML_SCHEMA, OUTPUT_XML_SCHEMA
 
 
@@ -15,12 +15,25 @@ class UnifiedTask(dspy.Signature):
     output_xml = dspy.OutputField(desc="Output XML following the output schema")
 
 
+class UnifiedRetryTask(dspy.Signature):
+    """Fix previously generated output XML so it validates against the output schema."""
+
+    input_schema = dspy.InputField(desc="Input XML schema", default=INPUT_XML_SCHEMA)
+    output_schema = dspy.InputField(desc="Output XML schema", default=OUTPUT_XML_SCHEMA)
+    input_xml = dspy.InputField(desc="Input XML following the input schema")
+    previous_output_xml = dspy.InputField(desc="Previously generated, invalid output XML")
+    validation_error = dspy.InputField(desc="Schema validation error for the previous output")
+    output_xml = dspy.OutputField(desc="Output XML following the output schema")
+
+
 class UnifiedModule(dspy.Module):
-    def __init__(self, predictor=None):
+    def __init__(self, predictor=None, max_retries: int = 2):
         super().__init__()
         self.console = Console()
         self.rating_module = RatingModule()
         self.predictor = predictor or dspy.Predict(UnifiedTask)
+        self.max_retries = max_retries
+        self.repair_stats = RepairStats()
 
         # Parse the schema for validation
         self.output_schema_parser = etree.XMLSchema(etree.XML(OUTPUT_XML_SCHEMA))
@@ -82,6 +95,18 @@ class UnifiedModule(dspy.Module):
         except (ValueError, TypeError) as e:
             return False, f"Validation error: {str(e)}"
 
+    def _retry_predictor(self):
+        """Predictor for retries, carrying the active predictor's instructions and demos.
+
+        Built on demand so it follows the predictor after optimization or loading.
+        """
+        signature = UnifiedRetryTask.with_instructions(
+            f"{self.predictor.signature.instructions}\n\n{UnifiedRetryTask.instructions}"
+        )
+        retry_predictor = dspy.Predict(signature)
+        retry_predictor.demos = list(self.predictor.demos)
+        return retry_predictor
+
     def forward(self, input_xml: str) -> str:
         """Generate the output XML based on the input XML."""
         self.console.print(f"Input XML:\n{input_xml}")
@@ -93,26 +118,48 @@ class UnifiedModule(dspy.Module):
         output_xml = result.output_xml
         self.console.print(f"Generated output XML:\n{output_xml}")
 
-        # Validate the output XML
+        self.repair_stats.calls += 1
         is_valid, error_message = self.validate_xml(output_xml)
+        if is_valid:
+            self.repair_stats.valid_first_try += 1
+            return output_xml
 
-        if not is_valid:
-            # If invalid, try to fix common issues
-            try:
-                # Parse with more lenient parser
-                root = ET.fromstring(output_xml)
-
-                # Convert back to string
-                output_xml = ET.tostring(root, encoding="unicode")
-
-                # Validate again
-                is_valid, error_message = self.validate_xml(output_xml)
-                if not is_valid:
-                    self.console.print(
-                        f"Warning: Generated XML is still invalid: {error_message}",
-                        style="yellow",
-                    )
-            except ET.ParseError as e:
-                self.console.print(f"Error fixing XML: {e}", style="red")
+        # Cheap local fixes first
+        output_xml, is_valid, error_message, applied = repair_xml(
+            output_xml, self.validate_xml
+        )
+        if is_valid:
+            self.console.print(
+                f"Repaired output XML locally: {', '.join(applied)}", style="yellow"
+            )
+            self.repair_stats.repaired_locally += 1
+            return output_xml
+
+        # Ask the model again with the schema error as feedback
+        retry_predictor = self._retry_predictor()
+        for attempt in range(1, self.max_retries + 1):
+            self.console.print(
+                f"Retry {attempt}/{self.max_retries} after validation error: {error_message}",
+                style="yellow",
+            )
+            self.repair_stats.retries += 1
+            result = retry_predictor(
+                input_schema=INPUT_XML_SCHEMA,
+                output_schema=OUTPUT_XML_SCHEMA,
+                input_xml=input_xml,
+                previous_output_xml=output_xml,
+                validation_error=error_message,
+            )
+            output_xml, is_valid, error_message, _ = repair_xml(
+                result.output_xml, self.validate_xml
+            )
+            if is_valid:
+                self.repair_stats.repaired_by_retry += 1
+                return output_xml
 
+        self.repair_stats.failed += 1
+        self.console.print(
+            f"Warning: Generated XML is still invalid: {error_message}",
+            style="yellow",
+        )
         return output_xml
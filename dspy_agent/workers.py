@@ -0,0 +1,325 @@
+"""File-backed job queue for running optimization work in separate processes.
+
+Each coordinator run gets its own subdirectory of the shared queue
+directory, with ``pending``, ``running``, ``done`` and ``failed``
+subdirectories, and removes it when it closes. Jobs are claimed by atomically
+renaming them from ``pending`` to ``running``, so any number of workers on
+one host, or on several hosts sharing the directory, can pull from the same
+queue.
+"""
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+
+STATES = ("pending", "running", "done", "failed")
+
+
+def _write_json(path: str, data: dict):
+    """Write JSON atomically so readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+class JobQueue:
+    """Directory-based job queue shared by a coordinator and its workers.
+
+    Workers open existing queues with ``create=False`` so they never bring
+    back the directory of a run that has been closed.
+    """
+
+    def __init__(
+        self,
+        queue_dir: str,
+        max_attempts: int = 3,
+        lease_seconds: float = 120,
+        create: bool = True,
+    ):
+        self.queue_dir = queue_dir
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        if create:
+            for state in STATES:
+                os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+
+    def _path(self, state: str, job_id: str) -> str:
+        return os.path.join(self.queue_dir, state, f"{job_id}.json")
+
+    def _store(self, state: str, job: dict):
+        try:
+            _write_json(self._path(state, job["id"]), job)
+        except FileNotFoundError:
+            pass  # the run was closed; nobody will collect this job
+
+    def submit(self, kind: str, payloads: list, settings: dict = None) -> list[str]:
+        """Queue one job per payload and return their ids in payload order."""
+        # Time-prefixed so claiming in name order is first-in, first-out
+        batch = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        job_ids = []
+        for index, payload in enumerate(payloads):
+            job_id = f"{batch}-{index:06d}"
+            _write_json(
+                self._path("pending", job_id),
+                {
+                    "id": job_id,
+                    "kind": kind,
+                    "payload": payload,
+                    "settings": settings or {},
+                    "attempts": 0,
+                    "max_attempts": self.max_attempts,
+                },
+            )
+            job_ids.append(job_id)
+        return job_ids
+
+    def claim(self):
+        """Take the oldest pending job, or return None if there is none."""
+        try:
+            names = sorted(os.listdir(os.path.join(self.queue_dir, "pending")))
+        except FileNotFoundError:
+            return None  # the run was closed
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            job_id = name[: -len(".json")]
+            running = self._path("running", job_id)
+            try:
+                os.rename(self._path("pending", job_id), running)
+            except FileNotFoundError:
+                continue  # another worker got it first
+            # rename keeps the mtime; start the lease now, not at submit time
+            self.heartbeat(job_id)
+            job = _read_json(running)
+            if job is not None:
+                return job
+        return None
+
+    def heartbeat(self, job_id: str):
+        try:
+            os.utime(self._path("running", job_id))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, job: dict, result):
+        self._store("done", {"id": job["id"], "result": result})
+        self._remove("running", job["id"])
+
+    def fail(self, job: dict, error: str):
+        """Requeue a failed job, or park it in ``failed`` once out of attempts."""
+        job = dict(job, attempts=job["attempts"] + 1, error=error)
+        max_attempts = job.get("max_attempts", self.max_attempts)
+        state = "pending" if job["attempts"] < max_attempts else "failed"
+        self._store(state, job)
+        self._remove("running", job["id"])
+
+    def requeue_stale(self):
+        """Fail jobs whose worker stopped sending heartbeats.
+
+        Like any failure this counts as an attempt, so a job that keeps
+        killing its worker ends up in ``failed`` instead of looping forever.
+        """
+        running_dir = os.path.join(self.queue_dir, "running")
+        now = time.time()
+        for name in os.listdir(running_dir):
+            if name.startswith(".") or not name.endswith(".json"):
+                continue
+            path = os.path.join(running_dir, name)
+            # Rename first so only one process requeues the job
+            stale = os.path.join(running_dir, f".stale_{name}")
+            try:
+                if now - os.path.getmtime(path) <= self.lease_seconds:
+                    continue
+                os.rename(path, stale)
+            except FileNotFoundError:
+                continue
+            job = _read_json(stale)
+            if job is not None:
+                self.fail(job, "worker stopped sending heartbeats")
+            os.remove(stale)
+
+    def cancel(self, job_ids: list):
+        """Drop jobs nobody will collect; a running one is discarded when its run closes."""
+        for job_id in job_ids:
+            for state in ("pending", "done", "failed"):
+                self._remove(state, job_id)
+
+    def collect(self, job_id: str):
+        """("done", result), ("failed", error) or None if the job hasn't finished."""
+        done = _read_json(self._path("done", job_id))
+        if done is not None:
+            self._remove("done", job_id)
+            return "done", done["result"]
+        failed = _read_json(self._path("failed", job_id))
+        if failed is not None:
+            self._remove("failed", job_id)
+            return "failed", failed.get("error", "")
+        return None
+
+    def _remove(self, state: str, job_id: str):
+        try:
+            os.remove(self._path(state, job_id))
+        except FileNotFoundError:
+            pass
+
+
+# Per-process state for job handlers
+_configured_settings = None
+_rating_module = None
+
+
+def _configure(settings: dict):
+    """Configure LM routes once per distinct settings dict."""
+    global _configured_settings
+    key = json.dumps(settings, sort_keys=True)
+    if settings.get("routes") and key != _configured_settings:
+        from .config import configure_routes
+
+        configure_routes(settings["routes"])
+        _configured_settings = key
+
+
+def _metric_handler(payload: dict) -> float:
+    global _rating_module
+    from .optimization import score_output
+    from .rating import RatingModule
+
+    if _rating_module is None:
+        _rating_module = RatingModule()
+    return score_output(payload["input_xml"], payload["output_xml"], _rating_module)
+
+
+HANDLERS = {"metric": _metric_handler}
+
+
+def _claim_any(queue_dir: str):
+    """Oldest pending job of any run in ``queue_dir`` as (queue, job), or (None, None)."""
+    try:
+        runs = sorted(os.listdir(queue_dir))
+    except FileNotFoundError:
+        return None, None
+    for run in runs:
+        if not run.startswith("run-"):
+            continue
+        queue = JobQueue(os.path.join(queue_dir, run), create=False)
+        job = queue.claim()
+        if job is not None:
+            return queue, job
+    return None, None
+
+
+def run_worker(queue_dir: str, poll_interval: float = 0.2, max_jobs: int = None):
+    """Process jobs from ``queue_dir`` until stopped (or ``max_jobs`` are done)."""
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        queue, job = _claim_any(queue_dir)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        stop = threading.Event()
+
+        def beat(job_id=job["id"]):
+            queue.heartbeat(job_id)
+            while not stop.wait(queue.lease_seconds / 4):
+                queue.heartbeat(job_id)
+
+        threading.Thread(target=beat, daemon=True).start()
+        try:
+            _configure(job["settings"])
+            result = HANDLERS[job["kind"]](job["payload"])
+            queue.complete(job, result)
+        except Exception:
+            queue.fail(job, f"{worker_id}: {traceback.format_exc()}")
+        finally:
+            stop.set()
+        processed += 1
+
+
+class Coordinator:
+    """Submits work to a JobQueue and gathers results in submission order.
+
+    Jobs go to a subdirectory of ``queue_dir`` owned by this coordinator and
+    deleted by ``close()``. With ``workers > 0`` that many local worker
+    processes are started; workers on other hosts can serve the same queue
+    via ``dspy-agent worker``.
+    """
+
+    def __init__(
+        self,
+        queue_dir: str,
+        workers: int = 0,
+        settings: dict = None,
+        max_attempts: int = 3,
+        poll_interval: float = 0.05,
+    ):
+        run_dir = os.path.join(queue_dir, f"run-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}")
+        self.queue = JobQueue(run_dir, max_attempts=max_attempts)
+        self.settings = settings or {}
+        self.poll_interval = poll_interval
+        context = multiprocessing.get_context("spawn")
+        self.processes = [
+            context.Process(target=run_worker, args=(queue_dir,), daemon=True)
+            for _ in range(workers)
+        ]
+        for process in self.processes:
+            process.start()
+
+    def map(self, kind: str, payloads: list, timeout: float = None) -> list:
+        """Run one job per payload and return results in payload order.
+
+        Failed jobs are retried by the queue up to ``max_attempts`` times;
+        a job that still fails raises RuntimeError. On any error the
+        remaining jobs of this call are cancelled.
+        """
+        job_ids = self.queue.submit(kind, payloads, self.settings)
+        results = {}
+        deadline = None if timeout is None else time.monotonic() + timeout
+        last_stale_check = time.monotonic()
+        try:
+            while len(results) < len(job_ids):
+                for job_id in job_ids:
+                    if job_id in results:
+                        continue
+                    outcome = self.queue.collect(job_id)
+                    if outcome is None:
+                        continue
+                    status, value = outcome
+                    if status == "failed":
+                        raise RuntimeError(f"Job {job_id} failed: {value}")
+                    results[job_id] = value
+                if len(results) == len(job_ids):
+                    break
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError(f"{len(job_ids) - len(results)} jobs did not finish in time")
+                if time.monotonic() - last_stale_check > self.queue.lease_seconds / 2:
+                    self.queue.requeue_stale()
+                    last_stale_check = time.monotonic()
+                time.sleep(self.poll_interval)
+        finally:
+            self.queue.cancel([job_id for job_id in job_ids if job_id not in results])
+        return [results[job_id] for job_id in job_ids]
+
+    def close(self):
+        """Stop local workers and delete this run's jobs from the queue directory."""
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        shutil.rmtree(self.queue.queue_dir, ignore_errors=True)
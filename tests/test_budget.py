@@ -0,0 +1,19 @@
+from dspy_agent.budget import TokenBudget, is_truncated
+
+
+def test_token_budget_shrinks_to_observed_outputs():
+    budget = TokenBudget(ceiling=1000, floor=64, min_samples=3)
+    assert budget.suggest() == 1000, "Should use the ceiling until enough samples"
+
+    for tokens in (100, 120, 110):
+        budget.record(tokens, truncated=False, continuations=0)
+
+    assert 120 <= budget.suggest() < 1000
+
+
+def test_is_truncated_detects_unclosed_root():
+    assert is_truncated("<updated_memory>done</updated_memory><new_plan><plan>")
+    assert not is_truncated("<updated_memory>done</updated_memory>")
+    assert not is_truncated("<new_plan>", finish_reason="stop"), "finish_reason wins"
+    assert is_truncated("anything", finish_reason="length")
+    assert not is_truncated("The <plan> element is missing", expect_xml=False)
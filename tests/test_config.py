@@ -0,0 +1,65 @@
+import copy
+import json
+
+from dspy.clients.engines.lm15_engine import LM15Engine
+from dspy.lm15 import Message, Response, TextPart, Usage
+
+from dspy_agent.config import configure_routes, get_lm, get_token_budget, load_routes
+
+
+def test_load_routes_applies_config_file_and_overrides(tmp_path):
+    config_file = tmp_path / "routes.json"
+    config_file.write_text(json.dumps({"rater": {"model": "flash", "max_tokens": 300}}))
+
+    routes = load_routes("test-model", str(config_file), proposer_model="proposer-model")
+
+    assert routes["agent"]["model"] == "test-model"
+    assert routes["agent"]["max_tokens"] == 1000
+    assert routes["rater"]["model"] == "flash"
+    assert routes["rater"]["max_tokens"] == 300
+    assert routes["proposer"]["model"] == "proposer-model"
+
+
+def test_configure_routes_shares_one_engine():
+    routes = load_routes("deepseek/deepseek-chat", rater_model="flash")
+    routes["proposer"]["api_base"] = "http://localhost:8000/v1"
+    configure_routes(routes)
+
+    agent, rater = get_lm("agent"), get_lm("rater")
+    assert isinstance(agent.engine, LM15Engine)
+    assert agent.engine is rater.engine, "Routes should share one engine and its connection pool"
+    assert copy.deepcopy(agent).engine is agent.engine, "Copies should keep the shared engine"
+    assert agent.engine.config.max_connections == 24
+    assert get_lm("proposer").engine == "auto", "Routes with their own client settings keep their own"
+
+
+class FakeEngine:
+    """Returns queued (text, finish_reason) completions."""
+
+    def __init__(self, completions):
+        self.completions = list(completions)
+        self.requests = []
+
+    def complete(self, request):
+        self.requests.append(request)
+        text, finish_reason = self.completions.pop(0)
+        return Response(
+            id=None,
+            model=request.model,
+            message=Message(role="assistant", parts=(TextPart(text),)),
+            finish_reason=finish_reason,
+            usage=Usage(input_tokens=10, output_tokens=7),
+        )
+
+
+def test_routed_lm_continues_truncated_output(recwarn):
+    configure_routes(load_routes("deepseek/deepseek-chat"))
+    engine = FakeEngine([("<plan>half", "length"), (" done</plan>", "stop")])
+    lm = get_lm("agent").copy(engine=engine)
+
+    assert lm("Make a plan") == ["<plan>half done</plan>"]
+    assert len(engine.requests) == 2, "A cut-off output should be continued once"
+    budget = get_token_budget("agent")
+    assert (budget.calls, budget.truncations, budget.continuations) == (1, 1, 1)
+    assert list(budget.samples) == [14], "Should use the reported completion tokens"
+    assert not [w for w in recwarn if "forward()" in str(w.message)], "Should not use the legacy engine"
@@ -0,0 +1,37 @@
+import json
+
+from dspy_agent.evaluation import Evaluator, ResultStore, example_hash, summarize
+
+
+def test_example_hash_ignores_unrelated_fields():
+    example = {"input_xml": "<test/>", "output_xml": "<test/>"}
+    assert example_hash(example) == example_hash({**example, "note": "ignored"})
+    assert example_hash(example) != example_hash({**example, "input_xml": "<other/>"})
+
+
+def test_result_store_roundtrip(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"))
+    result = {"score": 0.75, "is_valid": True, "memory": 7, "action": 6, "plan": 8}
+    store.put("program", "example", result)
+
+    assert store.get("program") == {"example": result}
+    assert store.get("other-program") == {}
+    store.close()
+
+
+def test_summarize_confidence_interval():
+    stats = summarize([1.0, 2.0, 3.0])
+    assert stats["mean"] == 2.0
+    assert stats["ci_low"] < 2.0 < stats["ci_high"]
+
+
+def test_program_hash_covers_route_settings_and_retries(tmp_path):
+    program = tmp_path / "program.json"
+    program.write_text("{}")
+    config = tmp_path / "routes.json"
+    config.write_text(json.dumps({"rater": {"max_tokens": 300}}))
+
+    base = Evaluator("flash")._program_hash(str(program))
+    assert base == Evaluator("openrouter/google/gemini-2.0-flash-001")._program_hash(str(program))
+    assert base != Evaluator("flash", config_path=str(config))._program_hash(str(program))
+    assert base != Evaluator("flash", max_retries=0)._program_hash(str(program))
@@ -0,0 +1,34 @@
+from dspy_agent.files import apply_file_operations
+
+
+def test_apply_file_operations_writes_and_skips_unchanged(tmp_path):
+    results = apply_file_operations([("out/a.txt", "hello\n", "write")], base_dir=str(tmp_path))
+    assert [r.status for r in results] == ["written"]
+    assert (tmp_path / "out" / "a.txt").read_text() == "hello\n"
+
+    results = apply_file_operations([("out/a.txt", "hello\n", "write")], base_dir=str(tmp_path))
+    assert [r.status for r in results] == ["unchanged"], "Same content should not be rewritten"
+
+
+def test_apply_file_operations_patch(tmp_path):
+    (tmp_path / "a.txt").write_text("one\ntwo\nthree\n")
+    patch = """--- a/a.txt
++++ b/a.txt
+@@ -1,3 +1,3 @@
+ one
+-two
++TWO
+ three
+    """  # trailing indentation, as before </operation>
+    results = apply_file_operations([("a.txt", patch, "patch")], base_dir=str(tmp_path))
+    assert [r.status for r in results] == ["written"]
+    assert (tmp_path / "a.txt").read_text() == "one\nTWO\nthree\n"
+
+
+def test_apply_file_operations_writes_through_symlink(tmp_path):
+    (tmp_path / "real.txt").write_text("orig\n")
+    (tmp_path / "link.txt").symlink_to(tmp_path / "real.txt")
+    results = apply_file_operations([("link.txt", "new\n", "write")], base_dir=str(tmp_path))
+    assert [r.status for r in results] == ["written"]
+    assert (tmp_path / "link.txt").is_symlink(), "The link should not be replaced by a plain file"
+    assert (tmp_path / "real.txt").read_text() == "new\n"
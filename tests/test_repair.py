@@ -0,0 +1,21 @@
+from dspy_agent.repair import balance_tags, repair_xml
+from dspy_agent.unified import UnifiedModule
+
+
+def test_balance_tags_closes_open_elements():
+    assert balance_tags("<a><b>x</a></c><d>") == "<a><b>x</b></a><d></d>"
+
+
+def test_repair_xml_fixes_fenced_unordered_output():
+    module = UnifiedModule()
+    broken_xml = """```xml
+    <new_plan><plan><goal>Test & check</goal></new_plan>
+    <updated_memory>test</updated_memory>
+    <execution_instructions><write_operations><operation type="message">Test</operation></write_operations></execution_instructions>
+    <is_done>false</is_done>
+    <expected_outcome>Test</expected_outcome>
+    ```"""
+    repaired, is_valid, _, applied = repair_xml(broken_xml, module.validate_xml)
+    assert is_valid, "Local fixes should produce valid XML"
+    assert "strip_fences" in applied
+    assert "reorder_elements" in applied
@@ -0,0 +1,31 @@
+from dspy_agent.shell import ShellSession
+
+
+def test_shell_session_keeps_state_between_commands(tmp_path):
+    with ShellSession() as shell:
+        shell.run(f"cd {tmp_path} && export AGENT_VAR=hello")
+        result = shell.run("pwd; echo $AGENT_VAR; exit_code_test() { return 3; }; exit_code_test")
+
+    assert result.output.split() == [str(tmp_path), "hello"]
+    assert result.exit_code == 3, "Should report the command's exit status"
+
+
+def test_shell_session_survives_timeout():
+    with ShellSession(timeout=1) as shell:
+        shell.run("export AGENT_VAR=kept")
+        timed_out = shell.run("sleep 10")
+        result = shell.run("echo $AGENT_VAR")
+
+    assert timed_out.timed_out, "Long command should time out"
+    assert result.output.strip() == "kept", "Session should survive the timeout"
+
+
+def test_shell_session_reports_exit(tmp_path):
+    with ShellSession(cwd=str(tmp_path)) as shell:
+        shell.run("export AGENT_VAR=lost")
+        exited = shell.run("echo bye; exit 3")
+        result = shell.run("echo ${AGENT_VAR:-unset}")
+
+    assert exited.output.startswith("bye\n")
+    assert "Shell session exited" in exited.output, "Should say the session was reset"
+    assert result.output.strip() == "unset", "A fresh shell should start after exit"
@@ -1,4 +1,6 @@
-from dspy_agent.unified import UnifiedModule
+import dspy
+
+from dspy_agent.unified import UnifiedModule, UnifiedTask
 
 def test_unified_module_initialization():
     module = UnifiedModule()
@@ -15,3 +17,52 @@ def test_xml_validation():
     """
     is_valid, _ = module.validate_xml(valid_xml)
     assert is_valid, "Should validate good XML"
+
+
+VALID_OUTPUT = """
+<updated_memory>test</updated_memory>
+<new_plan><plan><goal>Test</goal><steps><step id="1"><action>Test</action></step></steps></plan></new_plan>
+<execution_instructions><write_operations><operation type="message">Test</operation></write_operations></execution_instructions>
+<expected_outcome>Test</expected_outcome>
+<is_done>false</is_done>
+"""
+
+
+class StubPredictor:
+    """Returns queued output XML and records its calls."""
+
+    def __init__(self, outputs):
+        self.outputs = list(outputs)
+        self.calls = []
+
+    def __call__(self, **kwargs):
+        self.calls.append(kwargs)
+        return dspy.Prediction(output_xml=self.outputs.pop(0))
+
+
+def test_retry_predictor_follows_active_predictor():
+    predictor = dspy.Predict(UnifiedTask.with_instructions("Optimized instructions."))
+    predictor.demos = [dspy.Example(input_xml="<in/>", output_xml=VALID_OUTPUT)]
+    retry_predictor = UnifiedModule(predictor)._retry_predictor()
+
+    assert retry_predictor.demos == predictor.demos, "Retries should keep the optimized demos"
+    assert retry_predictor.signature.instructions.startswith("Optimized instructions.")
+
+
+def test_forward_retries_within_budget():
+    module = UnifiedModule(StubPredictor(["not xml"]), max_retries=2)
+    retry_predictor = StubPredictor(["still not xml", VALID_OUTPUT])
+    module._retry_predictor = lambda: retry_predictor
+
+    assert module("<input/>") == VALID_OUTPUT
+    stats = module.repair_stats
+    assert (stats.calls, stats.retries, stats.repaired_by_retry, stats.failed) == (1, 2, 1, 0)
+
+    module = UnifiedModule(StubPredictor(["not xml"]), max_retries=1)
+    retry_predictor = StubPredictor(["still not xml", VALID_OUTPUT])
+    module._retry_predictor = lambda: retry_predictor
+
+    module("<input/>")
+    assert len(retry_predictor.calls) == 1, "Should stop after max_retries"
+    stats = module.repair_stats
+    assert (stats.calls, stats.retries, stats.repaired_by_retry, stats.failed) == (1, 1, 0, 1)
@@ -0,0 +1,75 @@
+import os
+import threading
+import time
+
+import pytest
+
+from dspy_agent.workers import HANDLERS, Coordinator, JobQueue, run_worker
+
+
+def test_job_queue_retries_failed_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path), max_attempts=2)
+    [job_id] = queue.submit("metric", [{"input_xml": "<test/>"}])
+
+    job = queue.claim()
+    queue.fail(job, "first failure")
+    assert queue.collect(job_id) is None, "Job should be requeued"
+
+    job = queue.claim()
+    assert job["attempts"] == 1
+    queue.fail(job, "second failure")
+    assert queue.collect(job_id)[0] == "failed"
+
+
+def test_coordinator_map_returns_results_in_order(tmp_path, monkeypatch):
+    monkeypatch.setitem(HANDLERS, "double", lambda payload: payload * 2)
+    worker = threading.Thread(
+        target=run_worker,
+        args=(str(tmp_path),),
+        kwargs={"max_jobs": 3, "poll_interval": 0.01},
+        daemon=True,
+    )
+    worker.start()
+
+    results = Coordinator(str(tmp_path)).map("double", [3, 1, 2], timeout=10)
+
+    assert results == [6, 2, 4], "Results should follow submission order"
+
+
+def test_claim_starts_a_fresh_lease(tmp_path):
+    queue = JobQueue(str(tmp_path), lease_seconds=60)
+    [job_id] = queue.submit("metric", [{}])
+    pending = os.path.join(str(tmp_path), "pending", f"{job_id}.json")
+    old = time.time() - 120
+    os.utime(pending, (old, old))  # queued for longer than the lease
+
+    queue.claim()
+    queue.requeue_stale()
+
+    assert os.listdir(os.path.join(str(tmp_path), "pending")) == [], "Claimed job must not be requeued"
+
+
+def test_requeue_stale_counts_an_attempt(tmp_path):
+    queue = JobQueue(str(tmp_path), max_attempts=2, lease_seconds=0)
+    [job_id] = queue.submit("metric", [{}])
+
+    queue.claim()
+    time.sleep(0.01)
+    queue.requeue_stale()
+    assert queue.claim()["attempts"] == 1, "A lost lease should count as an attempt"
+    time.sleep(0.01)
+    queue.requeue_stale()
+
+    status, error = queue.collect(job_id)
+    assert status == "failed", "A job that keeps losing its worker should end up failed"
+    assert "heartbeats" in error
+
+
+def test_coordinator_cleans_up_after_timeout(tmp_path):
+    coordinator = Coordinator(str(tmp_path))
+    with pytest.raises(TimeoutError):
+        coordinator.map("double", [1, 2], timeout=0)
+    assert not os.listdir(os.path.join(coordinator.queue.queue_dir, "pending")), "Timed-out jobs should be cancelled"
+
+    coordinator.close()
+    assert not os.path.exists(coordinator.queue.queue_dir), "close should remove the run directory"